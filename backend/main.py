@@ -1,14 +1,99 @@
+import asyncio
+import logging
 import os
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+import orjson
+from async_lru import alru_cache
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi_cache import FastAPICache
+from fastapi_cache.decorator import cache
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import BaseModel, EmailStr
-from database import db, create_document, get_documents
-from schemas import User as UserSchema, Product as ProductSchema, Wishlist as WishlistSchema, Cart as CartSchema, Order as OrderSchema, Chat as ChatSchema
+import database
+from database import create_document
+from schemas import Product as ProductSchema, PyObjectId
 import hashlib
+import hmac
 from bson import ObjectId
-
-app = FastAPI(title="VibeFashion API")
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+class MongoORJSONResponse(ORJSONResponse):
+    """orjson response that stringifies ObjectId (and other unknown types)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Redis when configured so workers share one cache; otherwise fall back
+    # to a per-process in-memory backend with the same get/set/clear API.
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        from redis import asyncio as aioredis
+        from fastapi_cache.backends.redis import RedisBackend
+        backend = RedisBackend(aioredis.from_url(redis_url))
+    else:
+        from fastapi_cache.backends.inmemory import InMemoryBackend
+        backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix="vibefashion-cache")
+
+    db = database.connect()
+    app.state.mongo = db
+    if db is not None:
+        # Inverted text index so product search avoids full collection scans.
+        await db["product"].create_index([("title", "text"), ("description", "text"), ("tags", "text")])
+        await db["product"].create_index([("category_lc", 1)])
+        # Backfill category_lc on documents created before the field existed,
+        # otherwise the equality filter silently misses all older products.
+        await db["product"].update_many(
+            {"category_lc": {"$exists": False}},
+            [{"$set": {"category_lc": {"$toLower": "$category"}}}],
+        )
+        # Point lookups used by auth, cart, wishlist and chat history.
+        await db["user"].create_index("email", unique=True)
+        await db["cart"].create_index("user_id", unique=True)
+        await db["wishlist"].create_index("user_id")
+        # Chat is insert-ordered and read newest-first: keep it in a bounded
+        # capped collection and index by monotonic _id so the sorted history
+        # query is a pure index walk.
+        try:
+            await db.create_collection("chat", capped=True, size=1_000_000_000, max=10_000_000)
+        except CollectionInvalid:
+            # Client-side existence pre-check.
+            pass
+        except OperationFailure as exc:
+            # Parallel workers racing past the pre-check: the loser gets
+            # NamespaceExists (48) from the server. Already created is fine.
+            if exc.code != 48:
+                raise
+        await db["chat"].create_index([("room_id", 1), ("_id", -1)])
+    flusher = asyncio.create_task(_chat_flusher(db)) if db is not None else None
+    yield
+    if flusher is not None:
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+    database.close()
+
+
+app = FastAPI(title="VibeFashion API", default_response_class=MongoORJSONResponse, lifespan=lifespan)
+
+
+async def get_db(request: Request) -> AsyncIOMotorDatabase:
+    db = request.app.state.mongo
+    if db is None:
+        raise HTTPException(500, "Database not configured")
+    return db
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,6 +103,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Product/chat lists are highly compressible JSON; level 5 trades ~3-5x
+# smaller bodies for negligible CPU. Small responses are left alone.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 
 @app.get("/")
 def root():
@@ -25,7 +114,7 @@ def root():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     from database import db as _db
     ok = _db is not None
     return {
@@ -33,7 +122,7 @@ def test_database():
         "database": "✅ Connected" if ok else "❌ Not Connected",
         "database_url": "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set",
         "database_name": os.getenv("DATABASE_NAME") or "-",
-        "collections": (list(_db.list_collection_names()) if ok else []),
+        "collections": ((await _db.list_collection_names()) if ok else []),
     }
 
 
@@ -48,31 +137,58 @@ class LoginPayload(BaseModel):
     password: str
 
 
+_SCRYPT_PARAMS = {"n": 2**14, "r": 8, "p": 1, "dklen": 32}
+
+# Pre-initialized digest context; .copy() skips the per-call EVP_MD_CTX setup
+# when hashing legacy passwords (or any future bulk-migration path).
+_SHA_PROTO = hashlib.sha256()
+
+def _sha256_hex(pw: str) -> str:
+    h = _SHA_PROTO.copy()
+    h.update(pw.encode())
+    return h.hexdigest()
+
+# Collection defaults applied on insert; the request payloads are already
+# validated by FastAPI, so no second schema pass is needed.
+_USER_DEFAULTS = {"role": "buyer", "avatar": None, "phone": None, "is_active": True}
+
 def _hash(pw: str) -> str:
-    return hashlib.sha256(pw.encode()).hexdigest()
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(pw.encode(), salt=salt, **_SCRYPT_PARAMS)
+    return f"{salt.hex()}${digest.hex()}"
+
+def _verify(pw: str, stored: str) -> bool:
+    salt_hex, _, digest_hex = stored.partition("$")
+    if not digest_hex:
+        # Legacy unsalted SHA-256 hashes from before the scrypt migration.
+        return hmac.compare_digest(_sha256_hex(pw), stored)
+    digest = hashlib.scrypt(pw.encode(), salt=bytes.fromhex(salt_hex), **_SCRYPT_PARAMS)
+    return hmac.compare_digest(digest.hex(), digest_hex)
 
 
 @app.post("/api/auth/register")
-def register(body: RegisterPayload):
-    if db is None:
-        raise HTTPException(500, "Database not configured")
-    # check exists
-    existing = db["user"].find_one({"email": body.email})
-    if existing:
+async def register(body: RegisterPayload):
+    user = {
+        **_USER_DEFAULTS,
+        "email": body.email,
+        "password_hash": _hash(body.password),
+        "name": body.name,
+        "addresses": [],
+    }
+    # The unique index on email enforces existence; no preliminary find_one.
+    try:
+        uid = await create_document("user", user)
+    except DuplicateKeyError:
         raise HTTPException(400, "Email already registered")
-    user = UserSchema(email=body.email, password_hash=_hash(body.password), name=body.name)
-    uid = create_document("user", user)
     return {"user_id": uid, "email": body.email, "name": body.name}
 
 
 @app.post("/api/auth/login")
-def login(body: LoginPayload):
-    if db is None:
-        raise HTTPException(500, "Database not configured")
-    u = db["user"].find_one({"email": body.email})
+async def login(body: LoginPayload, db: AsyncIOMotorDatabase = Depends(get_db)):
+    u = await db["user"].find_one({"email": body.email})
     if not u:
         raise HTTPException(401, "Invalid credentials")
-    if u.get("password_hash") != _hash(body.password):
+    if not _verify(body.password, u.get("password_hash", "")):
         raise HTTPException(401, "Invalid credentials")
     return {"user_id": str(u.get("_id")), "email": u.get("email"), "name": u.get("name"), "role": u.get("role", "buyer")}
 
@@ -81,31 +197,87 @@ def login(body: LoginPayload):
 class CreateProductPayload(ProductSchema):
     pass
 
+# Product metadata is read-heavy and write-rare: the LRU deduplicates
+# concurrent lookups of the same id (single-flight) and keeps the hottest
+# products out of Mongo entirely. Callers must not mutate the cached doc.
+@alru_cache(maxsize=4096, ttl=60)
+async def _get_product(pid: str):
+    return await database.db["product"].find_one({"_id": ObjectId(pid)})
+
+# The unfiltered product list is the home page: identical for everyone, so
+# keep the last rendered result in-process and skip even the cache backend
+# round-trip. (monotonic timestamp, limit, precomputed items)
+_HOME_CACHE_TTL = 30.0
+_home_cache: tuple = (0.0, 0, [])
+
 @app.get("/api/products")
-def list_products(q: Optional[str] = None, category: Optional[str] = None, limit: int = 24):
-    if db is None:
-        raise HTTPException(500, "Database not configured")
+@cache(expire=30, namespace="products")
+async def list_products(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = Query(24, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    global _home_cache
+    if not q and not category:
+        ts, cached_limit, items = _home_cache
+        if cached_limit == limit and time.monotonic() - ts < _HOME_CACHE_TTL:
+            return {"items": items}
+    # Only the fields the product grid renders; $slice keeps the first image.
+    projection = {
+        "title": 1,
+        "price": 1,
+        "sale_price": 1,
+        "images": {"$slice": 1},
+        "category": 1,
+        "rating": 1,
+    }
     filt = {}
+    sort = None
     if q:
-        filt["title"] = {"$regex": q, "$options": "i"}
+        # $text hits the inverted index (with stemming) instead of the
+        # collection scan a case-insensitive $regex would force.
+        filt["$text"] = {"$search": q}
+        projection["score"] = {"$meta": "textScore"}
+        sort = [("score", {"$meta": "textScore"})]
     if category:
-        filt["category"] = {"$regex": f"^{category}$", "$options": "i"}
-    docs = db["product"].find(filt).limit(limit)
-    res = []
+        # Plain equality on the lowercased copy stored at insert time; a
+        # case-insensitive $regex would bypass the index entirely.
+        filt["category_lc"] = category.lower()
+    cursor = db["product"].find(filt, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    docs = await cursor.limit(limit).to_list(limit)
     for d in docs:
         d["id"] = str(d.pop("_id"))
-        res.append(d)
-    return {"items": res}
+    if not q and not category:
+        _home_cache = (time.monotonic(), limit, docs)
+    return {"items": docs}
+
+@app.get("/api/products/{product_id}")
+async def get_product(product_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(400, "Invalid product id")
+    doc = await _get_product(product_id)
+    if not doc:
+        raise HTTPException(404, "Product not found")
+    doc = dict(doc)  # copy so the cached entry stays unmutated
+    doc["id"] = str(doc.pop("_id"))
+    return doc
 
 @app.post("/api/products")
-def create_product(body: CreateProductPayload):
-    pid = create_document("product", body)
+async def create_product(body: CreateProductPayload):
+    doc = body.model_dump()
+    doc["category_lc"] = doc["category"].lower()
+    pid = await create_document("product", doc)
+    await FastAPICache.clear(namespace="products")
+    _get_product.cache_clear()
+    global _home_cache
+    _home_cache = (0.0, 0, [])
     return {"product_id": pid}
 
 @app.post("/api/seed-products")
-def seed_products():
-    if db is None:
-        raise HTTPException(500, "Database not configured")
+async def seed_products(db: AsyncIOMotorDatabase = Depends(get_db)):
     sample = [
         ProductSchema(
             title="Oversized Tee Minimal",
@@ -162,59 +334,110 @@ def seed_products():
             stock=120,
         ),
     ]
-    for p in sample:
-        db["product"].insert_one({**p.model_dump(), "created_at": None, "updated_at": None})
+    docs = [
+        {**p.model_dump(), "category_lc": p.category.lower(), "created_at": None, "updated_at": None}
+        for p in sample
+    ]
+    # One wire message instead of one round-trip per product; unordered so
+    # the server can parallelize and continue past individual failures.
+    await db["product"].insert_many(docs, ordered=False)
+    await FastAPICache.clear(namespace="products")
+    global _home_cache
+    _home_cache = (0.0, 0, [])
     return {"seeded": len(sample)}
 
 
 # ========== WISHLIST ==========
 class WishlistPayload(BaseModel):
     user_id: str
-    product_id: str
+    product_id: PyObjectId
 
 @app.get("/api/wishlist")
-def get_wishlist(user_id: str):
-    items = get_documents("wishlist", {"user_id": user_id})
+async def get_wishlist(user_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Join product metadata server-side in one round-trip instead of making
+    # the client fetch each product (N+1). product_id is stored as a string,
+    # so convert it first; entries whose product no longer exists drop out.
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$addFields": {"product_oid": {"$convert": {"input": "$product_id", "to": "objectId", "onError": None}}}},
+        {"$lookup": {"from": "product", "localField": "product_oid", "foreignField": "_id", "as": "product"}},
+        {"$unwind": "$product"},
+        {"$project": {
+            "user_id": 1,
+            "product_id": 1,
+            "product.title": 1,
+            "product.price": 1,
+            "product.sale_price": 1,
+            "product.images": {"$slice": ["$product.images", 1]},
+        }},
+    ]
+    items = await db["wishlist"].aggregate(pipeline).to_list(None)
     for i in items:
         i["id"] = str(i.pop("_id"))
     return {"items": items}
 
 @app.post("/api/wishlist")
-def add_wishlist(body: WishlistPayload):
-    wid = create_document("wishlist", WishlistSchema(**body.model_dump()))
+async def add_wishlist(body: WishlistPayload):
+    wid = await create_document("wishlist", body.model_dump())
     return {"wishlist_id": wid}
 
 
 # ========== CART ==========
 class CartItemPayload(BaseModel):
     user_id: str
-    product_id: str
+    product_id: PyObjectId
     qty: int = 1
 
+_CART_CACHE_TTL = 60
+
+def _cart_key(user_id: str) -> str:
+    return f"cart:{user_id}"
+
+async def _cart_cache_delete(user_id: str):
+    # InMemoryBackend.clear(key=...) does a bare `del` and raises KeyError
+    # when the cart was never cached (or already expired); treat that as
+    # already-invalidated. Don't use FastAPICache.clear(key=...): with a
+    # prefix set it takes the namespace branch and wipes every key.
+    try:
+        await FastAPICache.get_backend().clear(key=_cart_key(user_id))
+    except KeyError:
+        pass
+
 @app.get("/api/cart")
-def get_cart(user_id: str):
-    cart = db["cart"].find_one({"user_id": user_id})
-    if not cart:
-        cart = {"user_id": user_id, "items": []}
-        db["cart"].insert_one(cart)
-    cart["id"] = str(cart.pop("_id")) if cart.get("_id") else None
+async def get_cart(user_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    backend = FastAPICache.get_backend()
+    cached = await backend.get(_cart_key(user_id))
+    if cached is not None:
+        return orjson.loads(cached)
+    # Upsert-on-read: atomic, so two first-time GETs for the same user can't
+    # race an unconditional insert into a DuplicateKeyError on the unique
+    # user_id index.
+    cart = await db["cart"].find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"items": []}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    cart["id"] = str(cart.pop("_id"))
+    await backend.set(_cart_key(user_id), orjson.dumps(cart, default=str), _CART_CACHE_TTL)
     return cart
 
 @app.post("/api/cart")
-def add_to_cart(body: CartItemPayload):
-    c = db["cart"].find_one({"user_id": body.user_id})
-    if not c:
-        c = {"user_id": body.user_id, "items": []}
-    # upsert product
-    found = False
-    for it in c["items"]:
-        if it["product_id"] == body.product_id:
-            it["qty"] += body.qty
-            found = True
-            break
-    if not found:
-        c["items"].append({"product_id": body.product_id, "qty": body.qty})
-    db["cart"].update_one({"user_id": body.user_id}, {"$set": c}, upsert=True)
+async def add_to_cart(body: CartItemPayload, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Atomic server-side update: bump qty if the item is already in the cart,
+    # otherwise push a new entry. No read-modify-write, safe under concurrent
+    # POSTs for the same user.
+    res = await db["cart"].update_one(
+        {"user_id": body.user_id, "items.product_id": body.product_id},
+        {"$inc": {"items.$.qty": body.qty}},
+    )
+    if res.matched_count == 0:
+        await db["cart"].update_one(
+            {"user_id": body.user_id},
+            {"$push": {"items": {"product_id": body.product_id, "qty": body.qty}}},
+            upsert=True,
+        )
+    await _cart_cache_delete(body.user_id)
     return {"ok": True}
 
 
@@ -227,17 +450,12 @@ class CreateOrderPayload(BaseModel):
     address: dict
 
 @app.post("/api/orders")
-def create_order(body: CreateOrderPayload):
-    order = OrderSchema(
-        user_id=body.user_id,
-        items=body.items,
-        total=body.total,
-        payment_method=body.payment_method,
-        address=body.address,
-    )
-    oid = create_document("order", order)
+async def create_order(body: CreateOrderPayload, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Orders are critical writes: wait for majority acknowledgment.
+    oid = await create_document("order", {**body.model_dump(), "status": "new"}, write_concern=WriteConcern(w="majority"))
     # empty cart
-    db["cart"].update_one({"user_id": body.user_id}, {"$set": {"items": []}}, upsert=True)
+    await db["cart"].update_one({"user_id": body.user_id}, {"$set": {"items": []}}, upsert=True)
+    await _cart_cache_delete(body.user_id)
     return {"order_id": oid, "status": "new"}
 
 
@@ -247,23 +465,97 @@ class ChatSendPayload(BaseModel):
     sender_id: str
     message: str
 
+# Chat bursts are batched through an in-memory queue and flushed by a
+# background task, so N messages cost one insert_many instead of N
+# round-trips and journal syncs.
+_CHAT_BATCH_MAX = 100
+_CHAT_FLUSH_INTERVAL = 0.01  # seconds
+
+_chat_queue: asyncio.Queue = asyncio.Queue()
+
+async def _chat_flusher(db: AsyncIOMotorDatabase):
+    coll = db["chat"].with_options(write_concern=WriteConcern(w=1, j=False))
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch = [await _chat_queue.get()]
+            deadline = loop.time() + _CHAT_FLUSH_INTERVAL
+            while len(batch) < _CHAT_BATCH_MAX:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_chat_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await coll.insert_many(batch, ordered=False, bypass_document_validation=True)
+            except Exception:
+                logging.exception("chat flush failed (%d messages)", len(batch))
+            batch = []
+    except asyncio.CancelledError:
+        # Flush in-flight messages plus anything still queued before shutting
+        # down — send_chat already acknowledged their ids. Re-inserting a
+        # batch whose insert_many was interrupted mid-ack only produces
+        # duplicate-key errors (ids are pre-generated, flush is unordered),
+        # which the except below absorbs.
+        while not _chat_queue.empty():
+            batch.append(_chat_queue.get_nowait())
+        if batch:
+            try:
+                await coll.insert_many(batch, ordered=False, bypass_document_validation=True)
+            except Exception:
+                logging.exception("final chat flush failed (%d messages)", len(batch))
+        raise
+
 @app.get("/api/chat/{room_id}")
-def get_chat(room_id: str, limit: int = 50):
-    msgs = db["chat"].find({"room_id": room_id}).sort("created_at", -1).limit(limit)
-    res = []
+async def get_chat(
+    room_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    before: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # Sort by _id instead of created_at: it is monotonic, so ordering comes
+    # straight off the (room_id, _id) index. `before` pages back through
+    # older history by id cursor.
+    filt = {"room_id": room_id}
+    if before:
+        if not ObjectId.is_valid(before):
+            raise HTTPException(400, "Invalid cursor")
+        filt["_id"] = {"$lt": ObjectId(before)}
+    msgs = await (
+        db["chat"]
+        .find(filt, {"message": 1, "sender_id": 1, "created_at": 1})
+        .sort("_id", -1)
+        .limit(limit)
+        .to_list(limit)
+    )
+    msgs.reverse()  # oldest-first for display; in place, no copy
     for m in msgs:
         m["id"] = str(m.pop("_id"))
-        res.append(m)
-    return {"messages": list(reversed(res))}
+    return {"messages": msgs}
 
 @app.post("/api/chat")
-def send_chat(body: ChatSendPayload):
-    msg = ChatSchema(room_id=body.room_id, sender_id=body.sender_id, message=body.message)
-    mid = create_document("chat", msg)
-    return {"message_id": mid}
+async def send_chat(body: ChatSendPayload, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # The id is generated here, so we can hand it back immediately and let
+    # the background flusher batch the actual insert.
+    now = datetime.now(timezone.utc)
+    doc = {**body.model_dump(), "role": "user", "_id": ObjectId(), "created_at": now, "updated_at": now}
+    _chat_queue.put_nowait(doc)
+    return {"message_id": str(doc["_id"])}
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+    )
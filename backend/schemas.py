@@ -2,8 +2,19 @@
 Database Schemas for the Fashion E-commerce Platform
 Each Pydantic model represents a MongoDB collection (collection name = class name lowercased).
 """
-from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr
+from typing import Annotated, List, Optional
+from bson import ObjectId
+from pydantic import AfterValidator, BaseModel, Field, EmailStr
+
+def _check_object_id(v: str) -> str:
+    if not ObjectId.is_valid(v):
+        raise ValueError("Invalid ObjectId")
+    return v
+
+# A str that must parse as a Mongo ObjectId. Rejecting bad ids at request
+# validation time (cheap, in pydantic-core) beats a query that silently
+# matches nothing; the value stays a string to match how ids are stored.
+PyObjectId = Annotated[str, AfterValidator(_check_object_id)]
 
 # Core users
 class User(BaseModel):
@@ -35,7 +46,7 @@ class Product(BaseModel):
 # Wishlist
 class Wishlist(BaseModel):
     user_id: str
-    product_id: str
+    product_id: PyObjectId
 
 # Cart items
 class Cart(BaseModel):
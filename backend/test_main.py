@@ -0,0 +1,34 @@
+"""Tests for the API endpoints."""
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _FakeResult:
+    matched_count = 1
+
+
+class _FakeCollection:
+    async def update_one(self, *args, **kwargs):
+        return _FakeResult()
+
+
+class _FakeDB:
+    def __getitem__(self, name):
+        return _FakeCollection()
+
+
+def test_add_to_cart_without_prior_get():
+    # Regression: invalidating a cart that was never cached must not 500 —
+    # InMemoryBackend raises KeyError when deleting a missing key.
+    main.app.dependency_overrides[main.get_db] = lambda: _FakeDB()
+    try:
+        with TestClient(main.app) as client:
+            r = client.post(
+                "/api/cart",
+                json={"user_id": "u1", "product_id": "65f000000000000000000000", "qty": 1},
+            )
+            assert r.status_code == 200
+            assert r.json() == {"ok": True}
+    finally:
+        main.app.dependency_overrides.clear()
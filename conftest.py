@@ -0,0 +1 @@
+# Makes the repo root (database.py) importable from the backend tests.
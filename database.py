@@ -1,11 +1,13 @@
 """
 Database Helper Functions
 
-MongoDB helper functions ready to use in your backend code.
+Async MongoDB helper functions (Motor) ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -21,13 +23,48 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+def connect():
+    """Create the shared Motor client; returns the database (or None).
+
+    Motor opens connections lazily on the first awaited operation, so the
+    module-level client (and its pool) is shared by every request handler.
+    Explicit pool bounds: minPoolSize keeps warm connections ready so spikes
+    don't pay TCP/TLS/auth handshakes, maxPoolSize covers peak concurrency.
+    """
+    global _client, db
+    if _client is None and database_url and database_name:
+        _client = AsyncIOMotorClient(
+            database_url,
+            maxPoolSize=200,
+            minPoolSize=20,
+            maxIdleTimeMS=30000,
+            serverSelectionTimeoutMS=3000,
+            socketTimeoutMS=10000,
+            retryWrites=True,
+        )
+        db = _client[database_name]
+    return db
+
+def close():
+    """Close the shared Motor client (called from the app lifespan)."""
+    global _client, db
+    if _client is not None:
+        _client.close()
+        _client = None
+        db = None
+
+# Connect eagerly so scripts that import this module directly still work;
+# the FastAPI lifespan calls connect()/close() around the app's lifetime.
+connect()
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+async def create_document(collection_name: str, data: Union[BaseModel, dict], write_concern: WriteConcern = None):
+    """Insert a single document with timestamp; returns the new id.
+
+    The ObjectId is generated client-side so the id is known up front, and an
+    optional write_concern lets low-value writes skip the journal fsync while
+    critical ones wait for majority acknowledgment.
+    """
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -37,19 +74,23 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
+    data_dict['_id'] = ObjectId()
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
+    collection = db[collection_name]
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+    await collection.insert_one(data_dict)
+    return str(data_dict['_id'])
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
+
     cursor = db[collection_name].find(filter_dict or {})
     if limit:
         cursor = cursor.limit(limit)
-    
-    return list(cursor)
+
+    return await cursor.to_list(limit)